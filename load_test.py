@@ -0,0 +1,400 @@
+"""Headless load test for streamlit_app.py
+
+Starts the app on a single Streamlit worker with a mocked Bedrock backend, then
+drives N concurrent sessions over the Streamlit websocket protocol, clicking the
+preset and custom query buttons the same way the browser does. Reports
+throughput, per-rerun latency percentiles, memory per session and the
+saturation point for each concurrency level.
+
+Usage:
+    python load_test.py --users 1,2,4,8,16 --iterations 5 --bedrock-latency 0.5
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import websockets
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+APP_PATH = Path(__file__).parent / "streamlit_app.py"
+
+MOCK_TEAM_RESPONSE = """**PLAYER: Alpha**
+Current Team: Team One
+Role: Controller
+Primary Agents: Omen, Astra
+Backup Agents: Viper
+KDA: 1.35
+Winrate: 61.2%
+Best Maps: bind (70.00%), lotus (66.67%), ascent (60.00%)
+Reasoning: Alpha anchors the team as IGL with steady utility usage. They perform best on bind and lotus.
+
+**PLAYER: Bravo**
+Current Team: Team Two
+Role: Duelist
+Primary Agents: Jett, Raze
+Backup Agents: None
+KDA: 1.52
+Winrate: 58.0%
+Best Maps: ascent (68.00%), split (62.50%), bind (60.00%)
+Reasoning: Bravo creates space with aggressive entries. Their ascent numbers stand out.
+
+**PLAYER: Charlie**
+Current Team: Team Three
+Role: Sentinel
+Primary Agents: Killjoy, Cypher
+Backup Agents: Deadlock
+KDA: 1.21
+Winrate: 55.5%
+Best Maps: lotus (64.00%), bind (58.00%), sunset (55.00%)
+Reasoning: Charlie locks down sites reliably. They are strongest on lotus.
+
+**PLAYER: Delta**
+Current Team: Team One
+Role: Initiator
+Primary Agents: Sova, Fade
+Backup Agents: Skye
+KDA: 1.28
+Winrate: 57.1%
+Best Maps: ascent (65.00%), bind (61.00%), haven (57.00%)
+Reasoning: Delta provides consistent information for the team. Their ascent results lead the roster.
+
+**PLAYER: Echo**
+Current Team: Team Four
+Role: Flex
+Primary Agents: Viper, Killjoy
+Backup Agents: KAYO
+KDA: 1.18
+Winrate: 54.3%
+Best Maps: bind (63.00%), pearl (59.00%), lotus (56.00%)
+Reasoning: Echo fills whichever role the map needs. They add depth on bind and pearl.
+
+Team Analysis:
+The roster covers every role with flexible agent pools.
+Bind and lotus overlap as the strongest maps.
+The team could struggle on maps outside its shared pool."""
+
+CUSTOM_QUERIES = [
+    "Build a team with at least two players from the Americas",
+    "Build a team of rising stars with under 30 matches played",
+    "Build a team focused on strong lotus and bind performance",
+]
+
+FOLLOW_UPS = [
+    "Same team but swap the duelist for someone from EMEA",
+    "Same team but use a Pacific sentinel",
+]
+
+
+class MockBedrockClient:
+    """Stand-in for the bedrock-runtime client that returns a fixed team after a delay"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def invoke_model(self, modelId: str, body: str, contentType: str) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        response_body = {
+            "content": [{"type": "text", "text": MOCK_TEAM_RESPONSE}],
+            "usage": {
+                "input_tokens": len(body) // 4,
+                "output_tokens": len(MOCK_TEAM_RESPONSE) // 4
+            }
+        }
+        return {"body": io.BytesIO(json.dumps(response_body).encode())}
+
+
+def serve(port: int, bedrock_latency: float) -> None:
+    """Run the app on a Streamlit server with Bedrock replaced by the mock client"""
+    import boto3
+    from streamlit.web import cli
+
+    # the app re-imports boto3 on every rerun, so patching the module covers all sessions
+    boto3.client = lambda *args, **kwargs: MockBedrockClient(bedrock_latency)
+    cli.main([
+        "run", str(APP_PATH),
+        "--server.port", str(port),
+        "--server.headless", "true",
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false"
+    ])
+
+
+def get_free_port() -> int:
+    """Ask the OS for an unused local port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port: int, timeout: float) -> None:
+    """Block until the Streamlit health endpoint responds"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"Streamlit server did not start on port {port} within {timeout:.0f}s")
+
+
+def get_rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process in MB, read from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class SimulatedUser:
+    """One browser session talking to the app over the Streamlit websocket"""
+
+    def __init__(self, port: int, timeout: float):
+        self.url = f"ws://127.0.0.1:{port}/_stcore/stream"
+        self.timeout = timeout
+        self.websocket = None
+        # (element type, label) -> widget id from the latest run
+        self.widget_ids = {}
+        # widget id -> value the browser would send back on every rerun
+        self.widget_values = {}
+        self.latencies = []
+        self.errors = []
+
+    async def connect(self) -> None:
+        """Open the websocket the browser would use for this session"""
+        self.websocket = await websockets.connect(
+            self.url,
+            subprotocols=["streamlit"],
+            max_size=None
+        )
+
+    async def close(self) -> None:
+        """Close the session websocket"""
+        if self.websocket:
+            await self.websocket.close()
+
+    async def rerun(self, trigger: Optional[str] = None) -> None:
+        """Send a rerun with the current widget values and wait for the script to finish"""
+        widgets = []
+        for widget_id, value in self.widget_values.items():
+            widgets.append(WidgetState(id=widget_id, string_value=value))
+        if trigger:
+            widgets.append(WidgetState(id=trigger, trigger_value=True))
+
+        back_msg = BackMsg()
+        back_msg.rerun_script.widget_states.widgets.extend(widgets)
+
+        start = time.perf_counter()
+        await self.websocket.send(back_msg.SerializeToString())
+        widget_ids = {}
+
+        while True:
+            forward_msg = ForwardMsg()
+            forward_msg.ParseFromString(await asyncio.wait_for(self.websocket.recv(), self.timeout))
+            msg_type = forward_msg.WhichOneof("type")
+
+            if msg_type == "delta" and forward_msg.delta.WhichOneof("type") == "new_element":
+                element = forward_msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    self.errors.append(element.exception.message)
+                elif element_type == "alert" and element.alert.format == Alert.ERROR:
+                    self.errors.append(element.alert.body)
+                elif element_type in ("button", "selectbox", "text_area", "text_input"):
+                    widget = getattr(element, element_type)
+                    widget_ids[(element_type, widget.label)] = widget.id
+            elif msg_type == "script_finished":
+                if forward_msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                break
+
+        self.latencies.append(time.perf_counter() - start)
+        self.widget_ids = widget_ids
+
+    def set_value(self, element_type: str, label: str, value: str) -> None:
+        """Set a string widget value to send with the next rerun"""
+        self.widget_values[self.widget_ids[(element_type, label)]] = value
+
+    def button(self, label: str) -> Optional[str]:
+        """Widget id of a button from the latest run, if it was rendered"""
+        return self.widget_ids.get(("button", label))
+
+    async def run_preset(self) -> None:
+        """Switch to the preset view and click Generate Team"""
+        self.set_value("selectbox", "Select Type", "Click to Generate")
+        await self.rerun()
+        await self.rerun(trigger=self.button("Generate Team"))
+
+    async def run_custom_query(self, rng: random.Random) -> None:
+        """Run a custom query and refine it once if a conversation was started"""
+        self.set_value("selectbox", "Select Type", "Custom Query")
+        await self.rerun()
+        self.set_value("text_area", "Enter your Custom Query:", rng.choice(CUSTOM_QUERIES))
+        await self.rerun(trigger=self.button("Generate Team (Custom Query)"))
+
+        if self.button("Refine Team"):
+            self.set_value("text_input", "Describe what to change:", rng.choice(FOLLOW_UPS))
+            await self.rerun(trigger=self.button("Refine Team"))
+
+
+async def simulate_user(user: SimulatedUser, iterations: int, custom_ratio: float, seed: int) -> None:
+    """Load the app, then alternate between preset and custom query clicks"""
+    rng = random.Random(seed)
+    try:
+        await user.rerun()
+        for _ in range(iterations):
+            if rng.random() < custom_ratio:
+                await user.run_custom_query(rng)
+            else:
+                await user.run_preset()
+    except Exception as e:
+        user.errors.append(f"{type(e).__name__}: {str(e)}")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_level(users: int, server_pid: int, port: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run one concurrency level and summarize its reruns"""
+    rss_before = get_rss_mb(server_pid)
+    sessions = [SimulatedUser(port, args.timeout) for _ in range(users)]
+    await asyncio.gather(*(session.connect() for session in sessions))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        simulate_user(session, args.iterations, args.custom_ratio, args.seed + idx)
+        for idx, session in enumerate(sessions)
+    ))
+    elapsed = time.perf_counter() - start
+
+    # sessions are still open here, so their state still counts towards the worker's memory
+    rss_after = get_rss_mb(server_pid)
+    await asyncio.gather(*(session.close() for session in sessions))
+
+    latencies = [latency for session in sessions for latency in session.latencies]
+    errors = [error for session in sessions for error in session.errors]
+    memory_per_session = None
+    if rss_before is not None and rss_after is not None:
+        memory_per_session = max(rss_after - rss_before, 0.0) / users
+
+    return {
+        "users": users,
+        "reruns": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies) if latencies else 0.0,
+        "server_rss_mb": rss_after,
+        "memory_per_session_mb": memory_per_session
+    }
+
+
+def find_saturation(results: List[Dict[str, Any]], slo: float, min_gain: float) -> Dict[str, Any]:
+    """First level where p90 latency breaks the SLO or throughput stops scaling"""
+    for idx, current in enumerate(results):
+        if current["p90"] > slo:
+            return {"users": current["users"], "reason": f"p90 {current['p90']:.2f}s > SLO {slo:.2f}s"}
+        if idx and current["throughput"] < results[idx - 1]["throughput"] * (1 + min_gain):
+            return {"users": current["users"], "reason": f"throughput gain below {min_gain:.0%}"}
+    return {"users": None, "reason": "not reached"}
+
+
+def print_report(results: List[Dict[str, Any]], saturation: Dict[str, Any]) -> None:
+    """Print the load test results as a table"""
+    print(f"\n{'users':>6} {'reruns':>7} {'errors':>7} {'rerun/s':>8} {'p50 s':>7} {'p90 s':>7} "
+          f"{'p99 s':>7} {'max s':>7} {'MB/sess':>8} {'RSS MB':>8}")
+    for result in results:
+        memory = result["memory_per_session_mb"]
+        rss = result["server_rss_mb"]
+        print(
+            f"{result['users']:>6} {result['reruns']:>7} {result['errors']:>7} {result['throughput']:>8.2f} "
+            f"{result['p50']:>7.2f} {result['p90']:>7.2f} {result['p99']:>7.2f} {result['max']:>7.2f} "
+            f"{memory if memory is not None else float('nan'):>8.2f} {rss if rss is not None else float('nan'):>8.1f}"
+        )
+        for error in result["error_samples"]:
+            print(f"       error: {error}")
+
+    if saturation["users"] is None:
+        print("\nSaturation point: not reached")
+    else:
+        print(f"\nSaturation point: {saturation['users']} users ({saturation['reason']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test streamlit_app.py with a mocked Bedrock backend")
+    parser.add_argument("--users", default="1,2,4,8", help="Comma separated concurrent user levels")
+    parser.add_argument("--iterations", type=int, default=3, help="Preset/custom clicks per user")
+    parser.add_argument("--custom-ratio", type=float, default=0.5, help="Share of clicks that are custom queries")
+    parser.add_argument("--bedrock-latency", type=float, default=0.5, help="Mocked Bedrock response time in seconds")
+    parser.add_argument("--slo", type=float, default=5.0, help="Per-rerun p90 latency SLO in seconds")
+    parser.add_argument("--min-gain", type=float, default=0.1, help="Throughput gain below which a level counts as saturated")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Timeout for a single rerun in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for user actions")
+    parser.add_argument("--json", help="Optional path to write the results as JSON")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.bedrock_latency)
+        return
+
+    levels = [int(level) for level in args.users.split(",") if level.strip()]
+    port = get_free_port()
+
+    # the app reads its data and images relative to the working directory
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", str(port), "--bedrock-latency", str(args.bedrock_latency)],
+        cwd=APP_PATH.parent,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    results = []
+    try:
+        wait_for_server(port, timeout=60)
+        # one unmeasured session fills the player data cache so it isn't billed to the first level
+        print("Warming up...")
+        asyncio.run(run_level(1, server.pid, port, args))
+        for users in levels:
+            print(f"Running {users} concurrent user(s)...")
+            results.append(asyncio.run(run_level(users, server.pid, port, args)))
+    finally:
+        server.terminate()
+        server.wait()
+
+    saturation = find_saturation(results, args.slo, args.min_gain)
+    print_report(results, saturation)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "saturation": saturation}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,17 @@ import streamlit as st
 import boto3
 import json
 import os
+import re
+import threading
+import time
+from collections import deque
 from functools import lru_cache
 from typing import Dict, List, Any
 from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectTimeoutError, ReadTimeoutError
 
 AGENT_IMAGES = {
     "Astra": "images/Astra_icon.webp",
@@ -71,15 +77,134 @@ prompt_templates = {
     2. Statistical justification"""
 }
 
+ROLE_NAMES = ['Duelist', 'Controller', 'Sentinel', 'Initiator']
+
+# the data only has WEST/PACIFIC/SOUTHAMERICA/CHINESE regions, and WEST mixes
+# North America with EMEA, so VCT International teams are split out by name
+AMERICAS_INTERNATIONAL_TEAMS = {
+    "100 Thieves": "NORTH_AMERICA",
+    "Cloud9": "NORTH_AMERICA",
+    "Evil Geniuses": "NORTH_AMERICA",
+    "G2 Esports": "NORTH_AMERICA",
+    "NRG": "NORTH_AMERICA",
+    "Sentinels": "NORTH_AMERICA",
+    "LOUD": "SOUTH_AMERICA",
+    "MIBR": "SOUTH_AMERICA",
+    "FURIA": "SOUTH_AMERICA",
+    "KRÜ Esports": "SOUTH_AMERICA",
+    "Leviatán Esports": "SOUTH_AMERICA"
+}
+
+# maps words users type in follow-ups to player regions (see get_player_region);
+# WEST players outside VCT International may be from North America or EMEA
+REGION_ALIASES = {
+    "emea": ["EMEA", "WEST"],
+    "eu": ["EMEA", "WEST"],
+    "europe": ["EMEA", "WEST"],
+    "european": ["EMEA", "WEST"],
+    "na": ["NORTH_AMERICA", "WEST"],
+    "north america": ["NORTH_AMERICA", "WEST"],
+    "north american": ["NORTH_AMERICA", "WEST"],
+    "american": ["NORTH_AMERICA", "WEST"],
+    "west": ["NORTH_AMERICA", "EMEA", "WEST"],
+    "americas": ["NORTH_AMERICA", "SOUTH_AMERICA", "WEST"],
+    "south america": ["SOUTH_AMERICA"],
+    "south american": ["SOUTH_AMERICA"],
+    "latin america": ["SOUTH_AMERICA"],
+    "latin american": ["SOUTH_AMERICA"],
+    "latam": ["SOUTH_AMERICA"],
+    "brazil": ["SOUTH_AMERICA"],
+    "brazilian": ["SOUTH_AMERICA"],
+    "br": ["SOUTH_AMERICA"],
+    "pacific": ["PACIFIC"],
+    "apac": ["PACIFIC"],
+    "korea": ["PACIFIC"],
+    "korean": ["PACIFIC"],
+    "kr": ["PACIFIC"],
+    "japan": ["PACIFIC"],
+    "japanese": ["PACIFIC"],
+    "jp": ["PACIFIC"],
+    "china": ["CHINA"],
+    "chinese": ["CHINA"],
+    "cn": ["CHINA"]
+}
+
+# words before a team name in follow-ups, e.g. "someone from Sentinels"
+TEAM_PREPOSITIONS = {"from", "on", "of", "at", "in", "for", "with"}
+
+WEST_REGION_NOTE = "Candidates with region WEST may be from North America or EMEA; use the team name to check their region."
+
+# max players sent with a follow-up refinement
+FOLLOW_UP_CANDIDATE_LIMIT = 15
+
 
 load_dotenv()
 
+# opt in to Bedrock prompt caching for follow-up refinements (only sent to models in PROMPT_CACHING_MODELS)
+PROMPT_CACHING = os.getenv('BEDROCK_PROMPT_CACHING', 'false').lower() == 'true'
+
+# model tiers; costs are USD per million tokens and used for the sidebar estimates
+MODEL_TIERS = {
+    "fast": {
+        "model_id": os.getenv('BEDROCK_FAST_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0'),
+        "max_tokens": 1500,
+        "input_cost": 0.25,
+        "output_cost": 1.25
+    },
+    "large": {
+        "model_id": os.getenv('BEDROCK_LARGE_MODEL_ID', 'anthropic.claude-3-5-sonnet-20240620-v1:0'),
+        "max_tokens": 2000,
+        "input_cost": 3.0,
+        "output_cost": 15.0
+    }
+}
+
+# Bedrock models that accept cache_control; other models reject it with a ValidationException
+PROMPT_CACHING_MODELS = (
+    "anthropic.claude-3-5-haiku",
+    "anthropic.claude-3-7-sonnet",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4"
+)
+
+for tier_config in MODEL_TIERS.values():
+    tier_config["supports_caching"] = any(model in tier_config["model_id"] for model in PROMPT_CACHING_MODELS)
+
+# routing settings
+LATENCY_SLO_SECONDS = float(os.getenv('LATENCY_SLO_SECONDS', '20'))
+FAST_TIER_MAX_PROMPT_TOKENS = int(os.getenv('FAST_TIER_MAX_PROMPT_TOKENS', '50000'))
+MAX_ERROR_RATE = 0.5
+MIN_HEALTH_SAMPLES = 3
+METRICS_WINDOW = 50
+# only samples this recent count towards tier health, so a degraded tier is retried once they age out
+HEALTH_WINDOW_SECONDS = float(os.getenv('HEALTH_WINDOW_SECONDS', '300'))
+
+# Bedrock errors that are retried on the other model tier
+FALLBACK_ERROR_CODES = {
+    "ThrottlingException",
+    "ServiceUnavailableException",
+    "ModelTimeoutException",
+    "ModelNotReadyException",
+    "InternalServerException"
+}
+
+# permanent configuration errors; the tier is disabled for the rest of the worker's lifetime
+DISABLING_ERROR_CODES = {
+    "AccessDeniedException",
+    "ResourceNotFoundException"
+}
+
 # Initialize Bedrock client using environment variables
+# a single quick retry keeps a throttled or timed out tier from blocking the fallback
 bedrock_runtime_client = boto3.client(
     'bedrock-runtime',
     aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
     aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_REGION')
+    region_name=os.getenv('AWS_REGION'),
+    config=Config(
+        read_timeout=int(os.getenv('BEDROCK_READ_TIMEOUT', '60')),
+        retries={'max_attempts': 2, 'mode': 'standard'}
+    )
 )
 
 @st.cache_data
@@ -109,23 +234,12 @@ def calculate_team_map_stats(team_data: List[Dict[str, Any]]) -> Dict[str, float
     
     return map_stats
     
-def handle_custom_query(data: Dict[str, Any], custom_query: str, player_limit: int) -> None:
-    """Handle custom queries with raw LLM output display using Claude 3.5"""
-    
-    filtered_context = filter_context(data, "all", player_limit)
-    players_info = filtered_context["players"]
-    
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": f"""You are a VCT expert analyst. Create a competitive 5-player team composition using ONLY players from the provided list.
+def build_custom_query_prompt(players_section: str, custom_query: str) -> str:
+    """Build the custom query prompt around a given player list section"""
+    return f"""You are a VCT expert analyst. Create a competitive 5-player team composition using ONLY players from the provided list.
 You MUST follow the exact format and spacing specified below.
 
-Available players (Top {player_limit} performers):
-{json.dumps(players_info[:player_limit], indent=2)}
+{players_section}
 
 STRICT REQUIREMENTS:
 1. MUST include EXACTLY:
@@ -162,17 +276,169 @@ Team Analysis:
 [1 sentence about team composition and synergy]
 [1 sentence about strongest maps]
 [1 sentence about potential weaknesses]"""
-                }
-            ]
+
+
+@st.cache_resource
+def get_model_metrics() -> Dict[str, Any]:
+    """Per-tier latency/error/cost metrics shared by all sessions on this worker"""
+    return {
+        "lock": threading.Lock(),
+        "tiers": {
+            tier: {
+                "requests": 0,
+                "errors": 0,
+                "fallbacks": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cost": 0.0,
+                "latencies": deque(maxlen=METRICS_WINDOW),
+                "outcomes": deque(maxlen=METRICS_WINDOW),
+                "disabled": None
+            }
+            for tier in MODEL_TIERS
         }
-    ]
+    }
+
+
+def disable_tier(tier: str, reason: str) -> None:
+    """Stop routing to a tier after a permanent configuration error"""
+    metrics = get_model_metrics()
+    with metrics["lock"]:
+        metrics["tiers"][tier]["disabled"] = reason
 
+
+def record_model_call(tier: str, latency: float, usage: Dict[str, int] = None, error: bool = False) -> None:
+    """Record the outcome of one Bedrock call for a model tier"""
+    metrics = get_model_metrics()
+    with metrics["lock"]:
+        stats = metrics["tiers"][tier]
+        now = time.monotonic()
+        stats["requests"] += 1
+        stats["outcomes"].append((now, not error))
+        if error:
+            stats["errors"] += 1
+            return
+        
+        stats["latencies"].append((now, latency))
+        usage = usage or {}
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+        stats["cost"] += (
+            input_tokens * MODEL_TIERS[tier]["input_cost"] +
+            output_tokens * MODEL_TIERS[tier]["output_cost"]
+        ) / 1_000_000
+
+
+def record_fallback(tier: str) -> None:
+    """Count a request that moved on from this tier to the next one"""
+    metrics = get_model_metrics()
+    with metrics["lock"]:
+        metrics["tiers"][tier]["fallbacks"] += 1
+
+
+def latency_percentile(latencies: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of a list of latencies"""
+    if not latencies:
+        return 0.0
+    ordered = sorted(latencies)
+    index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def get_tier_summary(tier: str, max_age: float = None) -> Dict[str, float]:
+    """Summarize recent latency, error rate and total cost for a model tier"""
+    # samples are (timestamp, value); max_age drops those older than that many seconds
+    cutoff = time.monotonic() - max_age if max_age is not None else float('-inf')
+    metrics = get_model_metrics()
+    with metrics["lock"]:
+        stats = metrics["tiers"][tier]
+        latencies = [latency for timestamp, latency in stats["latencies"] if timestamp >= cutoff]
+        outcomes = [outcome for timestamp, outcome in stats["outcomes"] if timestamp >= cutoff]
+        return {
+            "requests": stats["requests"],
+            "fallbacks": stats["fallbacks"],
+            "error_rate": (outcomes.count(False) / len(outcomes)) if outcomes else 0.0,
+            "samples": len(outcomes),
+            "p50_latency": latency_percentile(latencies, 50),
+            "p95_latency": latency_percentile(latencies, 95),
+            "input_tokens": stats["input_tokens"],
+            "output_tokens": stats["output_tokens"],
+            "cost": stats["cost"],
+            "disabled": stats["disabled"]
+        }
+
+
+def tier_is_degraded(tier: str) -> bool:
+    """Check whether a tier is currently missing the latency SLO or erroring"""
+    summary = get_tier_summary(tier, max_age=HEALTH_WINDOW_SECONDS)
+    if summary["samples"] < MIN_HEALTH_SAMPLES:
+        return False
+    return summary["p95_latency"] > LATENCY_SLO_SECONDS or summary["error_rate"] > MAX_ERROR_RATE
+
+
+def route_model_tiers(messages: List[Dict[str, Any]], complexity: str) -> List[str]:
+    """Order the model tiers to try for a request, preferred tier first"""
+    # rough token estimate, ~4 characters per token
+    prompt_tokens = len(json.dumps(messages)) // 4
+    
+    if complexity == "simple" and prompt_tokens <= FAST_TIER_MAX_PROMPT_TOKENS:
+        tiers = ["fast", "large"]
+    else:
+        tiers = ["large", "fast"]
+    
+    # route around a tier that is currently slow or failing if the other one is healthy
+    if tier_is_degraded(tiers[0]) and not tier_is_degraded(tiers[1]):
+        tiers.reverse()
+    
+    # skip disabled tiers, unless that leaves nothing to try
+    enabled_tiers = [tier for tier in tiers if not get_tier_summary(tier)["disabled"]]
+    return enabled_tiers or tiers
+
+
+def is_fallback_error(error: Exception) -> bool:
+    """Check whether a Bedrock error should be retried on another model tier"""
+    if isinstance(error, (ConnectTimeoutError, ReadTimeoutError)):
+        return True
+    return isinstance(error, ClientError) and \
+        error.response.get("Error", {}).get("Code") in FALLBACK_ERROR_CODES
+
+
+def is_disabling_error(error: Exception) -> bool:
+    """Check whether a Bedrock error means the tier's model can't be used at all"""
+    return isinstance(error, ClientError) and \
+        error.response.get("Error", {}).get("Code") in DISABLING_ERROR_CODES
+
+
+def response_passes_validation(response_text: str) -> bool:
+    """Check that a response describes 5 unique players covering every role with one IGL"""
+    # don't let a rejected answer's analysis reach the display
+    team_data = parse_team_response(response_text, store_analysis=False)
+    names = {player['name'].lower() for player in team_data}
+    # roles like "Controller (IGL)" or "Controller/Flex" still cover the role
+    roles = [player['role'].lower() for player in team_data]
+    igl_count = sum(1 for player in team_data if player['igl'])
+    
+    return len(team_data) == 5 and len(names) == 5 and \
+        all(any(role.lower() in player_role for player_role in roles) for role in ROLE_NAMES) and \
+        igl_count == 1
+
+
+def invoke_model_tier(tier: str, messages: List[Dict[str, Any]], cache_prefix: bool = False) -> str:
+    """Send messages to a single model tier and record its metrics"""
+    if cache_prefix and PROMPT_CACHING and MODEL_TIERS[tier]["supports_caching"]:
+        # mark the end of the shared history so Bedrock can reuse it as a cached prefix
+        messages = json.loads(json.dumps(messages))
+        messages[-2]["content"][-1]["cache_control"] = {"type": "ephemeral"}
+    
+    start = time.perf_counter()
     try:
         response = bedrock_runtime_client.invoke_model(
-            modelId='anthropic.claude-3-5-sonnet-20240620-v1:0',
+            modelId=MODEL_TIERS[tier]["model_id"],
             body=json.dumps({
                 "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 2000,
+                "max_tokens": MODEL_TIERS[tier]["max_tokens"],
                 "messages": messages,
                 "temperature": 0.3,
                 "top_p": 0.9
@@ -181,26 +447,274 @@ Team Analysis:
         )
         
         response_body = json.loads(response['body'].read().decode())
-        response_text = response_body.get('content', [{}])[0].get('text', '')
+    except Exception as e:
+        if is_disabling_error(e):
+            disable_tier(tier, e.response["Error"]["Code"])
+        else:
+            record_model_call(tier, time.perf_counter() - start, error=True)
+        raise
+    
+    record_model_call(tier, time.perf_counter() - start, response_body.get('usage'))
+    return response_body.get('content', [{}])[0].get('text', '')
+
+
+def invoke_claude(messages: List[Dict[str, Any]], complexity: str = "complex", cache_prefix: bool = False) -> str:
+    """Send messages to Claude on Bedrock, routing between model tiers, and return the response text"""
+    tiers = route_model_tiers(messages, complexity)
+    fallback_text = ''
+    
+    for idx, tier in enumerate(tiers):
+        is_last_tier = idx == len(tiers) - 1
+        try:
+            response_text = invoke_model_tier(tier, messages, cache_prefix)
+        except Exception as e:
+            if is_last_tier or not (is_fallback_error(e) or is_disabling_error(e)):
+                if fallback_text:
+                    return fallback_text
+                raise
+            record_fallback(tier)
+            if is_disabling_error(e):
+                st.sidebar.error(
+                    f"{tier.title()} model {MODEL_TIERS[tier]['model_id']} disabled ({e.response['Error']['Code']}). "
+                    f"Check Bedrock model access; using the {tiers[idx + 1]} model until the app restarts."
+                )
+                continue
+            reason = e.response["Error"]["Code"] if isinstance(e, ClientError) else type(e).__name__
+            st.sidebar.warning(f"{tier.title()} model unavailable ({reason}), falling back to {tiers[idx + 1]} model")
+            continue
+        
+        # only a fast-tier answer is escalated; a large-tier answer is never replaced by a fast one
+        escalate_on_invalid = tier == "fast" and not is_last_tier and tiers[idx + 1] == "large"
+        if not escalate_on_invalid or response_passes_validation(response_text):
+            return response_text
+        
+        # keep the invalid response in case the large tier fails outright
+        fallback_text = response_text
+        record_fallback(tier)
+        st.sidebar.info(f"{tier.title()} model response failed validation, retrying with {tiers[idx + 1]} model")
+
+
+def display_model_metrics() -> None:
+    """Show per-tier latency and cost metrics in the sidebar"""
+    with st.sidebar.expander("Model Metrics"):
+        st.caption(f"Latency SLO: {LATENCY_SLO_SECONDS:.0f}s (p95)")
+        for tier in MODEL_TIERS:
+            summary = get_tier_summary(tier)
+            st.markdown(f"**{tier.title()}** ({MODEL_TIERS[tier]['model_id']})")
+            if summary["disabled"]:
+                st.error(f"Disabled: {summary['disabled']}")
+            st.text(
+                f"Requests: {summary['requests']} (fallbacks: {summary['fallbacks']})\n"
+                f"Error rate: {summary['error_rate']:.0%}\n"
+                f"Latency p50/p95: {summary['p50_latency']:.1f}s / {summary['p95_latency']:.1f}s\n"
+                f"Tokens in/out: {summary['input_tokens']} / {summary['output_tokens']}\n"
+                f"Est. cost: ${summary['cost']:.4f}"
+            )
+
+
+def display_custom_response(response_text: str) -> None:
+    """Show a custom query response as both the pretty and raw views"""
+    tab1, tab2 = st.tabs(["Pretty View", "Raw Response"])
+    
+    with tab1:
+        st.markdown("### Team Composition")
+        display_team_composition(response_text)
+        
+    with tab2:
+        st.markdown("### Raw LLM Response")
+        st.markdown("---")
+        st.markdown(response_text)
+
+
+def handle_custom_query(data: Dict[str, Any], custom_query: str, player_limit: int) -> None:
+    """Handle custom queries with raw LLM output display using the routed Claude model"""
+    
+    filtered_context = filter_context(data, "all", player_limit)
+    players_info = filtered_context["players"]
+    
+    players_section = f"""Available players (Top {player_limit} performers):
+{json.dumps(players_info[:player_limit], indent=2)}"""
+    
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": build_custom_query_prompt(players_section, custom_query)
+                }
+            ]
+        }
+    ]
+
+    try:
+        response_text = invoke_claude(messages)
         
         if response_text:
-            tab1, tab2 = st.tabs(["Pretty View", "Raw Response"])
-            
-            with tab1:
-                st.markdown("### Team Composition")
-                display_team_composition(response_text)
-                
-            with tab2:
-                st.markdown("### Raw LLM Response")
-                st.markdown("---")
-                st.markdown(response_text)
+            start_conversation(custom_query, player_limit, response_text)
+            display_custom_response(response_text)
             
     except Exception as e:
         st.error(f"Error processing custom query: {str(e)}")
         st.error("If you're seeing an input length error, try being more specific in your query to reduce the data needed.")
+
+
+def start_conversation(custom_query: str, player_limit: int, response_text: str) -> None:
+    """Keep a compact copy of the custom query exchange for follow-up refinements"""
+    # the player list is left out of the stored prompt; the chosen players are
+    # in the response and follow-ups carry their own small candidate set
+    players_section = f"""Available players: the top {player_limit} performers (list omitted; your previous answer contains the chosen players and follow-up requests list any additional candidates)."""
+    
+    st.session_state.conversation = {
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": build_custom_query_prompt(players_section, custom_query)
+                    }
+                ]
+            },
+            {
+                "role": "assistant",
+                "content": [{"type": "text", "text": response_text}]
+            }
+        ],
+        "team": [player['name'] for player in parse_team_response(response_text, store_analysis=False)]
+    }
+
+
+def get_player_region(player: Dict[str, Any]) -> str:
+    """Map a filtered player entry to the regions used by follow-up filters"""
+    region = player["region"]
+    if region == "WEST":
+        if player["team_category"] == "international":
+            return AMERICAS_INTERNATIONAL_TEAMS.get(player["team"], "EMEA")
+        # Challengers/Game Changers WEST teams can't be told apart from the data
+        return "WEST"
+    if region == "SOUTHAMERICA":
+        return "SOUTH_AMERICA"
+    if region == "CHINESE":
+        return "CHINA"
+    return region
+
+
+def compact_player(player: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a filtered player entry to the fields needed for a follow-up"""
+    map_winrates = player.get("statistics", {}).get("map_winrates", {})
+    best_maps = sorted(
+        ((map_name, winrate) for map_name, winrate in map_winrates.items() if winrate is not None),
+        key=lambda x: x[1],
+        reverse=True
+    )[:3]
+    
+    return {
+        "name": player["name"],
+        "team": player["team"],
+        "region": get_player_region(player),
+        "role": player["primary_role"],
+        "agents": player["agents"],
+        "kda": player["kda"],
+        "overall_winrate": player.get("statistics", {}).get("overall_winrate", 0),
+        "best_maps": [f"{map_name} ({winrate:.2f}%)" for map_name, winrate in best_maps]
+    }
+
+
+def names_team(text: str, match: re.Match, team_names: set) -> bool:
+    """Check whether a role word in a follow-up names a team, as in 'someone from Sentinels'"""
+    preceding = text[:match.start()].split()[-1:]
+    return match.group(0) in team_names and bool(preceding) and preceding[0] in TEAM_PREPOSITIONS
+
+
+def select_follow_up_candidates(players: List[Dict[str, Any]], follow_up: str, exclude: List[str],
+                                team_names: set, match_roles: bool = True) -> List[Dict[str, Any]]:
+    """Pick a small candidate set matching the roles and regions named in a follow-up"""
+    text = follow_up.lower()
+    
+    roles = []
+    if match_roles:
+        roles = [
+            role for role in ROLE_NAMES
+            if any(not names_team(text, match, team_names) for match in re.finditer(rf"\b{role.lower()}s?\b", text))
+        ]
+    
+    # longest aliases first, removing each match so "south american" doesn't also count as "american"
+    regions = set()
+    for alias in sorted(REGION_ALIASES, key=len, reverse=True):
+        text, matches = re.subn(rf"\b{alias}\b", " ", text)
+        if matches:
+            regions.update(REGION_ALIASES[alias])
+    
+    candidates = [
+        player for player in players
+        if player["name"] not in exclude
+        and (not roles or player["primary_role"] in roles)
+        and (not regions or get_player_region(player) in regions)
+    ]
+    # players with a known region come before the coarse WEST bucket, keeping KDA order otherwise
+    if regions:
+        candidates.sort(key=lambda player: get_player_region(player) == "WEST")
+    return [compact_player(player) for player in candidates[:FOLLOW_UP_CANDIDATE_LIMIT]]
+
+
+def refine_custom_query(data: Dict[str, Any], follow_up: str, player_limit: int) -> None:
+    """Refine the previous custom query team using only the changed constraints"""
+    conversation = st.session_state.conversation
+    
+    filtered_context = filter_context(data, "all", player_limit)
+    team_names = {player["team"]["name"].lower() for player in data.get("players", {}).values()}
+    candidates = select_follow_up_candidates(filtered_context["players"], follow_up, conversation["team"], team_names)
+    
+    if not candidates:
+        candidates = select_follow_up_candidates(
+            filtered_context["players"], follow_up, conversation["team"], team_names, match_roles=False
+        )
+        if candidates:
+            st.info("No players match both the role and region in your request, so candidates of any role are included.")
+    
+    if not candidates:
+        st.warning("No players match your request. Try raising the number of players to consider or loosening the request.")
+        return
+    
+    follow_up_message = {
+        "role": "user",
+        "content": [
+            {
+                "type": "text",
+                "text": f"""FOLLOW-UP REQUEST:
+{follow_up}
+
+Keep every player from your previous composition unless the request above asks to change them.
+Any new player MUST come from these additional candidates:
+{json.dumps(candidates)}
+{WEST_REGION_NOTE if any(player["region"] == "WEST" for player in candidates) else ""}
+
+All previous requirements still apply. Reply with the full updated team in the exact same format as before."""
+            }
+        ]
+    }
+    
+    try:
+        response_text = invoke_claude(conversation["messages"] + [follow_up_message], complexity="simple", cache_prefix=True)
+        
+        if response_text:
+            conversation["messages"] += [
+                follow_up_message,
+                {
+                    "role": "assistant",
+                    "content": [{"type": "text", "text": response_text}]
+                }
+            ]
+            conversation["team"] = [player['name'] for player in parse_team_response(response_text, store_analysis=False)]
+            display_custom_response(response_text)
+            
+    except Exception as e:
+        st.error(f"Error refining custom query: {str(e)}")
+        st.error("Try starting over with a new custom query if the conversation has grown too long.")
     
 def query_bedrock(prompt_type: str, context: Dict[str, Any], player_limit: int) -> str:
-    """Query Amazon Bedrock with enhanced player data using Claude 3.5"""
+    """Query Amazon Bedrock with enhanced player data using the routed Claude model"""
     
     filtered_context = filter_context(context, prompt_type, player_limit)
     
@@ -292,20 +806,7 @@ Team Analysis:
     ]
 
     try:
-        response = bedrock_runtime_client.invoke_model(
-            modelId='anthropic.claude-3-5-sonnet-20240620-v1:0',
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 2000,
-                "messages": messages,
-                "temperature": 0.3,
-                "top_p": 0.9
-            }),
-            contentType='application/json'
-        )
-        
-        response_body = json.loads(response['body'].read().decode())
-        return response_body.get('content', [{}])[0].get('text', '')
+        return invoke_claude(messages, complexity="simple")
             
     except Exception as e:
         st.error(f"Error querying Bedrock: {str(e)}")
@@ -396,7 +897,7 @@ def filter_context(context: Dict[str, Any], prompt_type: str, player_limit: int)
     st.sidebar.write(f"Filtered to top {len(filtered_players)} players")
     return {"players": filtered_players}
 
-def parse_team_response(response: str) -> List[Dict[str, Any]]:
+def parse_team_response(response: str, store_analysis: bool = True) -> List[Dict[str, Any]]:
     """Parse the LLM response with enhanced format handling including team information"""
     team_data = []
     team_analysis = ""
@@ -474,7 +975,7 @@ def parse_team_response(response: str) -> List[Dict[str, Any]]:
         if player_data['name']:  
             team_data.append(player_data)
     
-    if team_analysis:
+    if team_analysis and store_analysis:
         st.session_state.team_analysis = team_analysis
         
         try:
@@ -709,6 +1210,35 @@ def main():
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
                     st.info("Try adjusting the player limit or being more specific in your query.")
+        
+        if "conversation" in st.session_state:
+            st.markdown("""
+            ### Refine Last Team
+            """)
+            
+            follow_up = st.text_input(
+                "Describe what to change:",
+                placeholder="Same team but swap the duelist for someone from EMEA",
+                help="Only the change and a few matching candidates are sent, so refinements are faster than a new query"
+            )
+            
+            col1, col2 = st.columns([1, 4])
+            with col1:
+                refine_button = st.button("Refine Team", key="refine_query_button")
+            with col2:
+                if st.button("Start Over", key="reset_conversation_button"):
+                    del st.session_state.conversation
+                    st.info("Conversation cleared. Enter a new custom query to start again.")
+            
+            if refine_button and follow_up.strip() and "conversation" in st.session_state:
+                with st.spinner("Refining team..."):
+                    try:
+                        refine_custom_query(data, follow_up, player_limit)
+                    except Exception as e:
+                        st.error(f"Error: {str(e)}")
+                        st.info("Try starting over with a new custom query.")
+    
+    display_model_metrics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file